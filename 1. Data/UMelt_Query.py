@@ -0,0 +1,377 @@
+
+#############################################################################
+# General information
+#############################################################################
+
+# This script allows to query the UMelt record (GeoTIFFs from 4TU.ResearchData) for a region and period of interest,
+# without loading an entire melt season in memory.
+# Each melt season GeoTIFF stores the individual predictions (per 12 hours) as bands.
+# The record is divided in tiles (spatial index) and the bands are indexed by their time (time index),
+# so that a query only reads the tiles that intersect the region of interest and the bands within the period of interest.
+# Recently used tiles are kept in memory (LRU cache), and several queries can be run at the same time (thread pool).
+
+# Example:
+#   record = UMeltRecord(['UMelt_AllData_MeltSeason1819.tif', 'UMelt_AllData_MeltSeason1920.tif'])
+#   meltDays = record.meltDays(basin, '2018-11-01', '2019-04-01')
+#   onset = record.meltOnset(basin, '2018-11-01', '2019-04-01')
+#   series = record.timeSeries([(-2420000, 700000)], '2018-11-01', '2019-04-01', crs='EPSG:3031')
+#   futures = [record.submit('meltDays', basin, start, end) for start, end in periods]
+
+# Any questions? Happy to hear! You can reach me at S.deRodaHusman@tudelft.nl
+
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.features import geometry_mask
+from rasterio.transform import rowcol
+from rasterio.warp import transform as transformCoords
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, from_bounds
+
+
+#############################################################################
+# Set variables
+#############################################################################
+
+# Size of the tiles (in pixels) used for the spatial index and the cache
+tile_size = 256
+
+# Maximum number of chunks (one tile of one band) kept in memory
+max_cached_chunks = 4096
+
+# Number of queries that can be run at the same time
+max_workers = 4
+
+# Predictions above this value are considered as melt
+threshold_melt = 0.5
+
+# Coordinate reference system of the regions and points of interest (by default longitude/latitude,
+# as for the ROI in the prediction script)
+crs_query = 'EPSG:4326'
+
+# Number of points added along each edge of a region of interest before reprojecting it
+# (edges that are straight in longitude/latitude are curved in polar stereographic coordinates).
+# In longitude/latitude each edge follows the shortest way in longitude, so edges may cross the antimeridian
+# (e.g. from 170 to -170 for the Ross Ice Shelf). A region that contains the South Pole is given as a ring around
+# the pole with edges shorter than 180 degrees in longitude (e.g. vertices every 90 degrees at the same latitude),
+# or directly in the coordinates of the record (crs='EPSG:3031').
+densify_points = 100
+
+# Result of a query over a region of interest: 'data' is a masked array (pixels outside the region, and pixels
+# without data for all predictions in the period of interest are masked), 'transform' and 'crs' georeference the array.
+MeltGrid = namedtuple('MeltGrid', ['data', 'transform', 'crs'])
+
+# Result of a query at points: 'times' has one entry per prediction, 'values' has shape (points, times)
+MeltSeries = namedtuple('MeltSeries', ['times', 'values'])
+
+
+#############################################################################
+# Time index
+#############################################################################
+
+# Function to get the time of a prediction from its band name.
+# Band names contain either the local overpass time in milliseconds (e.g. 'Prediction_1482386400000',
+# as exported by the prediction script) or a date (e.g. '2016-12-22T06' or '20161222_06').
+def parseBandTime(name):
+    millis = re.search(r'(?<!\d)(\d{12,13})(?!\d)', name)
+    if millis:
+        return np.datetime64(int(millis.group(1)), 'ms')
+
+    date = re.search(r'(\d{4})-?(\d{2})-?(\d{2})(?:[T_\- ]?(\d{2}))?', name)
+    if date:
+        year, month, day, hour = date.groups()
+        return np.datetime64('%s-%s-%sT%s' % (year, month, day, hour or '00'), 'ms')
+
+    raise ValueError('Cannot derive the time of band %r, provide band_times instead' % name)
+
+# Function to convert a date ('yyyy-MM-dd', datetime or datetime64) to datetime64
+def toDatetime64(date):
+    return np.datetime64(date, 'ms')
+
+
+#############################################################################
+# UMelt record
+#############################################################################
+
+class UMeltRecord:
+
+    # paths: GeoTIFFs of the melt seasons (all on the same grid, as provided on 4TU.ResearchData)
+    # band_times: optional dictionary {path: list of times}, when the band names do not contain the time
+    def __init__(self, paths, band_times=None, tile_size=tile_size, max_cached_chunks=max_cached_chunks,
+                 max_workers=max_workers, threshold=threshold_melt):
+        self.paths = list(paths)
+        self.tile_size = tile_size
+        self.max_cached_chunks = max_cached_chunks
+        self.threshold = threshold
+
+        # Build the time index: all predictions sorted by time, with the file and band they are stored in
+        index = []
+        for path in self.paths:
+            with rasterio.open(path) as src:
+                if path == self.paths[0]:
+                    self.crs = src.crs
+                    self.transform = src.transform
+                    self.width = src.width
+                    self.height = src.height
+                    self.nodata = src.nodata
+                elif src.transform != self.transform or (src.width, src.height) != (self.width, self.height):
+                    raise ValueError('%s is not on the same grid as %s' % (path, self.paths[0]))
+
+                if band_times is not None and path in band_times:
+                    times = [toDatetime64(t) for t in band_times[path]]
+                else:
+                    times = [parseBandTime(src.descriptions[b] or '') for b in range(src.count)]
+                if len(times) != src.count:
+                    raise ValueError('%s has %d bands but %d band times' % (path, src.count, len(times)))
+                index += [(t, path, b + 1) for b, t in enumerate(times)]
+
+        index.sort(key=lambda entry: entry[0])
+        self.times = np.array([entry[0] for entry in index], dtype='datetime64[ms]')
+        self.bands = [(entry[1], entry[2]) for entry in index]
+
+        # The spatial index is a regular grid of tiles (tile_size x tile_size pixels) over the record.
+        # LRU cache of chunks {(path, band, tile_row, tile_col): array}
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        # Every thread keeps its own open files (rasterio datasets can not be shared between threads),
+        # all open files are also listed so that they can be closed
+        self._local = threading.local()
+        self._open_datasets = []
+        self._datasets_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def close(self):
+        self._executor.shutdown()
+        with self._datasets_lock:
+            for dataset in self._open_datasets:
+                dataset.close()
+            self._open_datasets = []
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    #############################################################################
+    # Concurrent queries
+    #############################################################################
+
+    # Function to run a query in the thread pool, returns a future (e.g. submit('meltDays', basin, start, end))
+    def submit(self, query, *args, **kwargs):
+        return self._executor.submit(getattr(self, query), *args, **kwargs)
+
+    #############################################################################
+    # Reading tiles
+    #############################################################################
+
+    def _dataset(self, path):
+        datasets = getattr(self._local, 'datasets', None)
+        if datasets is None:
+            datasets = self._local.datasets = {}
+        if path not in datasets:
+            datasets[path] = rasterio.open(path)
+            with self._datasets_lock:
+                self._open_datasets.append(datasets[path])
+        return datasets[path]
+
+    def _tileWindow(self, tile_row, tile_col):
+        row_off = tile_row * self.tile_size
+        col_off = tile_col * self.tile_size
+        return Window(col_off, row_off,
+                      min(self.tile_size, self.width - col_off),
+                      min(self.tile_size, self.height - row_off))
+
+    # Function to select the predictions within the period of interest (start included, end excluded)
+    def _selectTimes(self, start, end):
+        first, last = np.searchsorted(self.times, [toDatetime64(start), toDatetime64(end)])
+        return int(first), int(last)
+
+    # Function to read a tile for the selected predictions, shape (times, rows, cols).
+    # Chunks in the cache are reused, the other chunks are read per file in a single read.
+    def _readTile(self, tile_row, tile_col, first, last):
+        window = self._tileWindow(tile_row, tile_col)
+        stack = np.empty((last - first, window.height, window.width), dtype='float32')
+
+        missing = {}
+        with self._cache_lock:
+            for i in range(first, last):
+                path, band = self.bands[i]
+                key = (path, band, tile_row, tile_col)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    stack[i - first] = self._cache[key]
+                else:
+                    missing.setdefault(path, []).append((i, band))
+
+        for path, entries in missing.items():
+            data = self._dataset(path).read([band for i, band in entries], window=window).astype('float32')
+            if self.nodata is not None:
+                data[data == self.nodata] = np.nan
+
+            with self._cache_lock:
+                for (i, band), chunk in zip(entries, data):
+                    stack[i - first] = chunk
+                    # Copy, so that the cached chunk does not keep the array of the whole read in memory
+                    self._cache[(path, band, tile_row, tile_col)] = chunk.copy()
+                while len(self._cache) > self.max_cached_chunks:
+                    self._cache.popitem(last=False)
+
+        return stack
+
+    # Function to find the tiles that intersect the region of interest.
+    # Returns the window of the region and, per tile, the mask of the region within that tile.
+    def _intersectingTiles(self, geometry, crs):
+        if crs is not None:
+            geographic = CRS.from_user_input(crs).is_geographic
+            geometry = transform_geom(crs, self.crs, _densifyGeometry(geometry, densify_points, geographic))
+
+        coords = np.array(_flattenCoordinates(geometry['coordinates']))
+        bounds = from_bounds(coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max(),
+                             transform=self.transform)
+
+        # Pixel window of the region of interest, limited to the extent of the record
+        row0 = min(max(int(np.floor(bounds.row_off)), 0), self.height)
+        col0 = min(max(int(np.floor(bounds.col_off)), 0), self.width)
+        row1 = min(max(int(np.ceil(bounds.row_off + bounds.height)), row0), self.height)
+        col1 = min(max(int(np.ceil(bounds.col_off + bounds.width)), col0), self.width)
+        window = Window(col0, row0, col1 - col0, row1 - row0)
+
+        tiles = []
+        if window.width == 0 or window.height == 0:
+            return window, tiles
+        for tile_row in range(window.row_off // self.tile_size,
+                              (window.row_off + window.height - 1) // self.tile_size + 1):
+            for tile_col in range(window.col_off // self.tile_size,
+                                  (window.col_off + window.width - 1) // self.tile_size + 1):
+                tile_window = self._tileWindow(tile_row, tile_col)
+                inside = ~geometry_mask([geometry], out_shape=(tile_window.height, tile_window.width),
+                                        transform=rasterio.windows.transform(tile_window, self.transform))
+                if inside.any():
+                    tiles.append((tile_row, tile_col, tile_window, inside))
+        return window, tiles
+
+    # Function to apply a per-pixel computation on the tiles intersecting the region of interest and
+    # merge the results into one grid covering the region of interest.
+    def _reduceRegion(self, geometry, start, end, crs, reducer, dtype, fill):
+        window, tiles = self._intersectingTiles(geometry, crs)
+        first, last = self._selectTimes(start, end)
+
+        data = np.full((window.height, window.width), fill, dtype=dtype)
+        mask = np.ones((window.height, window.width), dtype=bool)
+        for tile_row, tile_col, tile_window, inside in tiles:
+            stack = self._readTile(tile_row, tile_col, first, last)
+            result = reducer(stack, self.times[first:last])
+
+            # Pixels without data (e.g. outside the ice shelves) for all predictions are masked
+            no_data = np.isnan(stack).all(axis=0) if last > first else np.zeros(inside.shape, dtype=bool)
+
+            # Position of the tile within the region of interest
+            r0 = max(window.row_off, tile_window.row_off)
+            r1 = min(window.row_off + window.height, tile_window.row_off + tile_window.height)
+            c0 = max(window.col_off, tile_window.col_off)
+            c1 = min(window.col_off + window.width, tile_window.col_off + tile_window.width)
+            region = (slice(r0 - window.row_off, r1 - window.row_off), slice(c0 - window.col_off, c1 - window.col_off))
+            tile = (slice(r0 - tile_window.row_off, r1 - tile_window.row_off), slice(c0 - tile_window.col_off, c1 - tile_window.col_off))
+
+            data[region] = np.where(inside[tile], result[tile], data[region])
+            mask[region] &= ~(inside[tile] & ~no_data[tile])
+
+        return MeltGrid(np.ma.masked_array(data, mask=mask),
+                        rasterio.windows.transform(window, self.transform), self.crs)
+
+    #############################################################################
+    # Queries
+    #############################################################################
+
+    # Number of melt days per pixel (a day is a melt day if the 6 AM or 6 PM prediction indicates melt)
+    def meltDays(self, geometry, start, end, crs=crs_query):
+        return self._reduceRegion(geometry, start, end, crs, self._countMeltDays, 'int32', 0)
+
+    # First time melt is detected per pixel (NaT if no melt)
+    def meltOnset(self, geometry, start, end, crs=crs_query):
+        return self._reduceRegion(geometry, start, end, crs,
+                                  lambda stack, times: _firstMelt(stack > self.threshold, times),
+                                  'datetime64[ms]', np.datetime64('NaT'))
+
+    # Last time melt is detected per pixel (NaT if no melt)
+    def freezeUp(self, geometry, start, end, crs=crs_query):
+        return self._reduceRegion(geometry, start, end, crs,
+                                  lambda stack, times: _firstMelt((stack > self.threshold)[::-1], times[::-1]),
+                                  'datetime64[ms]', np.datetime64('NaT'))
+
+    # Predictions at points [(x, y), ...] for the period of interest (NaN outside the record or without data)
+    def timeSeries(self, points, start, end, crs=crs_query):
+        first, last = self._selectTimes(start, end)
+        values = np.full((len(points), last - first), np.nan, dtype='float32')
+
+        xs, ys = [p[0] for p in points], [p[1] for p in points]
+        if crs is not None:
+            xs, ys = transformCoords(crs, self.crs, xs, ys)
+        rows, cols = rowcol(self.transform, xs, ys)
+
+        # Group points per tile, so that each tile is read once
+        per_tile = {}
+        for i, (row, col) in enumerate(zip(rows, cols)):
+            if 0 <= row < self.height and 0 <= col < self.width:
+                per_tile.setdefault((row // self.tile_size, col // self.tile_size), []).append((i, row, col))
+
+        for (tile_row, tile_col), entries in per_tile.items():
+            stack = self._readTile(tile_row, tile_col, first, last)
+            for i, row, col in entries:
+                values[i] = stack[:, row - tile_row * self.tile_size, col - tile_col * self.tile_size]
+
+        return MeltSeries(self.times[first:last], values)
+
+    def _countMeltDays(self, stack, times):
+        melt = stack > self.threshold
+        if len(times) == 0:
+            return np.zeros(stack.shape[1:], dtype='int32')
+
+        # Predictions are sorted by time, so predictions of the same day are next to each other
+        days = times.astype('datetime64[D]')
+        day_starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        return np.logical_or.reduceat(melt, day_starts, axis=0).sum(axis=0).astype('int32')
+
+
+#############################################################################
+# Helper functions
+#############################################################################
+
+# Function to get the time of the first melt per pixel (NaT if no melt)
+def _firstMelt(melt, times):
+    result = np.full(melt.shape[1:], np.datetime64('NaT'), dtype='datetime64[ms]')
+    if len(times) == 0:
+        return result
+    any_melt = melt.any(axis=0)
+    result[any_melt] = times[melt.argmax(axis=0)][any_melt]
+    return result
+
+# Function to add n points along each edge of a (multi)polygon.
+# For longitude/latitude (geographic) the shortest way in longitude is taken, also across the antimeridian.
+def _densifyGeometry(geometry, n, geographic=False):
+    def densifyCoordinates(coords):
+        if isinstance(coords[0][0], (int, float)):
+            ring = []
+            for (x0, y0), (x1, y1) in zip(coords[:-1], coords[1:]):
+                dx = (x1 - x0 + 180) % 360 - 180 if geographic else x1 - x0
+                for i in range(n + 1):
+                    x = x0 + dx * i / (n + 1)
+                    ring.append([(x + 180) % 360 - 180 if geographic else x, y0 + (y1 - y0) * i / (n + 1)])
+            return ring + [list(coords[-1])]
+        return [densifyCoordinates(part) for part in coords]
+
+    return dict(geometry, coordinates=densifyCoordinates(geometry['coordinates']))
+
+# Function to list all vertices of a (multi)polygon
+def _flattenCoordinates(coords):
+    if isinstance(coords[0], (int, float)):
+        return [coords]
+    return [c for part in coords for c in _flattenCoordinates(part)]
@@ -0,0 +1,580 @@
+
+#############################################################################
+# General information
+#############################################################################
+
+# This script contains the preprocessing of the input features (Step 1) and the prediction (Step 4) as stages of one pipeline.
+# The run parameters (period and region of interest, thresholds, input features, model, ...) are read from a configuration
+# file (UMelt_Config.json), which contains common parameters and one set of parameters per run (e.g. 'training', 'prediction').
+
+# The stages of all runs are compiled into one graph. A stage only depends on its own parameters and on its input stages,
+# so stages that are shared between runs with identical parameters (e.g. the DEM, or the Sentinel-1 melt of two
+# predictions over the same region) are computed once and reused. An experiment that only changes a few parameters
+# (e.g. a feature importance run without ASCAT) only recomputes the stages that depend on these parameters.
+
+# Example:
+#   config = loadConfig('UMelt_Config.json')
+#   pipeline = Pipeline(config)
+#   predictedCol = pipeline.run('prediction')
+#
+#   # Feature importance: prediction without ASCAT (only the matching of overpasses, the input features and the
+#   # prediction are recomputed, the melt computations are reused). This requires a U-Net trained without ASCAT.
+#   pipeline.addRun('prediction_NoASCAT', dict(config['runs']['prediction'],
+#                   features=['elevation', 'melt_S1_climatology', 'melt_SSMIS'], join_order=['melt_SSMIS'],
+#                   model=dict(config['runs']['prediction']['model'], name='AttUnet_500mShackletonTrained_NoASCAT')))
+#   predictedCol_NoASCAT = pipeline.run('prediction_NoASCAT')
+
+# Any questions? Happy to hear! You can reach me at S.deRodaHusman@tudelft.nl
+
+import hashlib
+import json
+from collections import namedtuple
+
+import ee
+
+
+#############################################################################
+# Configuration
+#############################################################################
+
+# Load the configuration file. It contains:
+#   regions: named regions of interest (polygon coordinates or the asset id of a feature collection)
+#   common:  parameters shared by all runs
+#   runs:    parameters per run (overriding the common parameters), 'output' is the final stage of the run
+def loadConfig(path):
+    with open(path) as f:
+        return json.load(f)
+
+# Parameters of a run: common parameters, overridden by the parameters of the run.
+# The region of interest is replaced by its coordinates (or asset id), so that runs over the same region share stages.
+# The satellite data matched per overpass ('overpass_bands') are derived from the features and labels, so that
+# the matching of overpasses only depends on these data (and not on e.g. elevation or slope).
+def runParameters(config, run_params):
+    params = dict(config.get('common', {}))
+    params.update(run_params)
+    if isinstance(params.get('roi'), str) and params['roi'] in config.get('regions', {}):
+        params['roi'] = config['regions'][params['roi']]
+    if all(key in params for key in ['join_primary', 'join_order', 'features', 'labels']):
+        params['overpass_bands'] = overpassInputs(params)
+    return params
+
+
+#############################################################################
+# Helper functions
+#############################################################################
+
+# Winter (e.g. June - August) preceding a melt year
+def winterPeriod(year, params):
+    start = ee.Date.fromYMD(year - 1, params['winter_start'], 1)
+    end = ee.Date.fromYMD(year - 1, params['winter_end'], 1).advance(1, 'month').advance(-1, 'day')
+    return start, end
+
+# Melt years (defined from April-1 year N - March-31 year N+1, named after year N+1)
+def meltYearPeriod(year):
+    return '%d-04-01' % (year - 1), '%d-03-31' % year
+
+# Reproject to the spatial resolution and projection of the predictions
+def reprojectCollection(collection, params):
+    return collection.map(lambda img: img.reproject(**{'crs': params['crs'], 'scale': params['scale_spatialres']}))
+
+# Only select dates in which melt is expected (Nov - March, Antarctic summer months)
+def selectSummer(collection):
+    return collection.filter(ee.Filter.calendarRange(11, 3, 'month'))
+
+# Rename band and add LocalTime date field (used to match the overpasses)
+def renameBandAddLocalTime(collection, name):
+    return collection.map(lambda img: img.rename(name).set('LocalTime', ee.Date(img.get('system:time_start')).millis()))
+
+# Fuction to add local overpass time time to properties
+def localTime(img):
+    geometry_centr = ee.Feature(img.geometry()).centroid()
+    centroidInfo = img.int().reduceToVectors(**{'geometry': geometry_centr.geometry(), 'scale': 10, 'maxPixels': 1e10, 'geometryType': "centroid", 'tileScale': 16})
+    lon = centroidInfo.geometry().coordinates().get(0)
+    localtime = img.date().advance(ee.Number(lon).divide(15), 'hour')
+    localtime_millis = ee.Date(localtime).millis()
+    return img.set('LocalTime', localtime_millis)
+
+# Function to compute area of footprint (to later remove areas having a footprint < 100 km2,
+# since these are 'slice' images that give errors when computing coordinates in 'localTime' function)
+def areaFootprint(img):
+    area = img.geometry().area().divide(1000 * 1000)
+    return img.set('area', area)
+
+# Filters that can be applied on the satellite data (listed per sensor in the configuration):
+#   maskHighElevation: mask areas > elevation_max (no melt expected)
+#   removeBorderNoise: clip the outer 2000 m of each image
+def applyFilters(collection, filters, DEM, params):
+    for name in filters:
+        if name == 'maskHighElevation':
+            collection = collection.map(lambda img: img.updateMask(DEM.lt(params['elevation_max'])))
+        elif name == 'removeBorderNoise':
+            collection = collection.map(lambda img: img.clip(img.geometry().buffer(-2000)))
+        else:
+            raise ValueError('Unknown filter: %s' % name)
+    return collection
+
+
+#############################################################################
+# Stages: region of interest and elevation
+#############################################################################
+
+def stageROI(params, inputs):
+    if isinstance(params['roi'], str):
+        return ee.FeatureCollection(params['roi']).geometry()
+    return ee.Geometry.Polygon(params['roi'])
+
+def stageDEM(params, inputs):
+    REMA = ee.Image("users/sophiederoda/GeneralAntarcticData/REMA_200m_dem_filled").rename('elevation')
+    return REMA.reproject(**{'crs': params['crs'], 'scale': params['scale_spatialres']})
+
+# Normalized elevation
+def stageElevation(params, inputs):
+    normElevation = inputs['DEM'].unitScale(0, params['elevation_max'])
+    return normElevation.reproject(**{'crs': params['crs'], 'scale': params['scale_spatialres']})
+
+# Normalized slope (derived from the DEM)
+def stageSlope(params, inputs):
+    normSlope = ee.Terrain.slope(inputs['DEM']).unitScale(0, params['slope_max']).rename('slope')
+    return normSlope.reproject(**{'crs': params['crs'], 'scale': params['scale_spatialres']})
+
+
+#############################################################################
+# Stages: Sentinel-1
+#############################################################################
+
+# Preprocessed Sentinel-1 image collection
+def stageS1(params, inputs):
+    S1 = ee.ImageCollection("COPERNICUS/S1_GRD_FLOAT") \
+        .filter(ee.Filter.listContains('transmitterReceiverPolarisation', 'HH')) \
+        .select('HH') \
+        .filterDate(params['start_clim'], params['end_clim']) \
+        .filterBounds(inputs['roi']) \
+        .map(localTime) \
+        .map(areaFootprint) \
+        .filterMetadata('area', 'greater_than', 100)
+    return applyFilters(S1, params['S1_filters'], inputs['DEM'], params)
+
+# Sentinel-1 binary melt, per melt year and per orbit
+def stageMeltS1(params, inputs):
+    S1 = inputs['S1']
+    threshold_s0_float = ee.Number(10).pow(ee.Number(-params['threshold_s0_dB']).multiply(0.1))
+
+    S1_melt = None
+    for year in params['S1_melt_years']:
+
+        # Extract available orbits (in winter months)
+        S1_winter = S1.filterDate(*winterPeriod(year, params))
+        S1_orbits = ee.Dictionary(S1_winter.aggregate_histogram('relativeOrbitNumber_start')).keys()
+        S1_year = S1.filterDate(*meltYearPeriod(year))
+
+        # (map evaluates the function right away, so the variables of the current year are used)
+        def meltComputationS1(orbit):
+            S1_m = S1_year.filter(ee.Filter.eq('relativeOrbitNumber_start', ee.Number.parse(orbit).toInt()))
+            S1_w = S1_m.filter(ee.Filter.calendarRange(params['winter_start'], params['winter_end'], 'month')).mean().min(ee.Image(5))
+            S1_c = S1_m.map(lambda img: img.addBands(img.lt(S1_w.multiply(threshold_s0_float)).toFloat().rename('melt')))
+            return S1_c.toList(S1_c.size())
+
+        S1_year_melt = ee.ImageCollection.fromImages(S1_orbits.map(meltComputationS1).flatten()).select('melt')
+        S1_melt = S1_year_melt if S1_melt is None else S1_melt.merge(S1_year_melt)
+
+    S1_melt = selectSummer(S1_melt.select('melt'))
+    S1_melt = S1_melt.map(lambda img: img.reproject(**{'crs': params['crs'], 'scale': params['scale_spatialres']}).toInt())
+    return S1_melt.map(lambda img: img.rename('melt_S1'))
+
+# Sentinel-1 backscatter in dB
+def stageS1dB(params, inputs):
+    return inputs['S1'].map(lambda img: img.log10().multiply(10).rename(['HH_dB']).copyProperties(img, ["LocalTime"]))
+
+# Sentinel-1 monthly climatology, excluding one year at a time
+def stageS1Climatology(params, inputs):
+    months = ee.List.sequence(1, 12)
+
+    S1climatology = None
+    for year in params['climatology_years']:
+
+        def computeS1ClimatologyExcluding(m):
+            return inputs['melt_S1'].filter(ee.Filter.calendarRange(year, year, 'year').Not()) \
+                    .filter(ee.Filter.calendarRange(m, m, 'month')) \
+                    .mean() \
+                    .rename('melt_S1_climatology') \
+                    .set('month', m).set('year', year)
+
+        S1climatology_year = ee.ImageCollection.fromImages(months.map(computeS1ClimatologyExcluding).flatten())
+        S1climatology = S1climatology_year if S1climatology is None else S1climatology.merge(S1climatology_year)
+
+    return reprojectCollection(S1climatology, params)
+
+
+#############################################################################
+# Stages: ASCAT
+#############################################################################
+
+# Preprocessed ASCAT image collection
+def stageAscat(params, inputs):
+
+    # Normalize the 8-bit images (from -32 to 0 dB)
+    def normalizeAscatRaw(img):
+        scaledImage = img.multiply(32.0/255.0).subtract(32)
+        return scaledImage.double().copyProperties(img, ["system:time_start", "hour"])
+
+    # Transfer dB values to float(10^(x*0.1))
+    def dBtoFloat(img):
+        floatImage = ee.Image(10).pow(img.multiply(0.1))
+        return floatImage.copyProperties(img, ["system:time_start", "hour"])
+
+    ascat = ee.ImageCollection(params['ascat_assets'][0])
+    for asset in params['ascat_assets'][1:]:
+        ascat = ascat.merge(ee.ImageCollection(asset))
+
+    ascat = ascat \
+        .sort('system:time_start') \
+        .filterDate(params['start_clim'], params['end_clim']) \
+        .map(normalizeAscatRaw) \
+        .map(dBtoFloat)
+    return applyFilters(ascat, params['ascat_filters'], inputs['DEM'], params)
+
+# Temporal interpolation of the morning (6 AM) or evening (6 PM) overpasses:
+# missing observations on alternate dates are replaced by the mean of the previous and next days
+def interpolateAscat(ascat, start, end, hour):
+    startDate = ee.Date(start).advance(hour, 'hour')
+    endDate = ee.Date(end).advance(hour, 'hour')
+
+    observed = ascat \
+        .sort('system:time_start') \
+        .filterDate(startDate, endDate) \
+        .filterMetadata('hour', 'equals', hour) \
+        .map(lambda img: img.rename('sigma0'))
+
+    # Create list of missing dates on alternate dates
+    missingDates = ee.List.sequence(startDate.advance(1, 'days').millis(), endDate.millis(), 2*24*60*60*1000)
+    n = missingDates.size().getInfo()
+
+    def maskedImage(i):
+        return ee.Image(0).selfMask() \
+            .rename('sigma0') \
+            .set('system:time_start', ee.Date(missingDates.get(i)).millis())
+    emptyCol = ee.ImageCollection(ee.List.sequence(0, n-2).map(maskedImage))
+
+    # Add date field (format: YMD)
+    def addDateYMD(img):
+        return img.set('DateYMD', ee.Date(img.get('system:time_start')).format("yyyy-MM-dd-kk")).rename('sigma0')
+    mergedCol = observed.merge(emptyCol).map(addDateYMD).sort('DateYMD')
+
+    def temporalInterpolation(image):
+        currentDate = ee.Date(image.get('system:time_start'))
+        interpolatedImage = mergedCol.filterDate(currentDate.advance(-2, 'days'), currentDate.advance(2, 'days')).mean()
+        return interpolatedImage.where(image, image).copyProperties(image, ['system:time_start', 'DateYMD'])
+
+    return mergedCol.map(temporalInterpolation)
+
+# Continuous ASCAT melt (difference with the winter mean), per melt year
+def stageMeltAscat(params, inputs):
+    ascat = inputs['ascat']
+    if params['ascat_interpolation']:
+        start, end = params['ascat_interpolation']
+        ascat = interpolateAscat(ascat, start, end, 6).merge(interpolateAscat(ascat, start, end, 18))
+
+    ascat_melt = None
+    for year in params['melt_years']:
+        ascat_winter = ascat.filterDate(*winterPeriod(year, params)).mean()
+        ascat_year = ascat.filterDate(*meltYearPeriod(year))
+
+        def meltComputationAscat(img):
+            return img.addBands(img.subtract(ascat_winter).toFloat().rename(['melt'])).copyProperties(img, ["system:time_start"])
+
+        ascat_year_melt = ascat_year.map(meltComputationAscat)
+        ascat_melt = ascat_year_melt if ascat_melt is None else ascat_melt.merge(ascat_year_melt)
+
+    ascat_melt = selectSummer(ascat_melt.select('melt'))
+
+    # Normalize each ASCAT image based on minumum and maximum values
+    ascat_melt = ascat_melt.map(lambda img: img.unitScale(params['ascat_melt_min'], params['ascat_melt_max']).copyProperties(img, ["system:time_start"]))
+
+    ascat_melt = reprojectCollection(ascat_melt, params)
+    return renameBandAddLocalTime(ascat_melt, 'melt_ascat')
+
+
+#############################################################################
+# Stages: SSMIS
+#############################################################################
+
+# Preprocessed SSMIS image collection
+def stageSSMIS(params, inputs):
+    SSMIS = ee.ImageCollection(params['SSMIS_assets'][0])
+    for asset in params['SSMIS_assets'][1:]:
+        SSMIS = SSMIS.merge(ee.ImageCollection(asset))
+
+    SSMIS = SSMIS.select('b1')
+
+    # Convert Brightness Temperature to Kelvin (scale factor: 0.01)
+    def scaleSSMIS(img):
+        scaledImage = img.divide(100)
+        return scaledImage.double().copyProperties(img, ["system:time_start"]).copyProperties(img, ["overpass"])
+
+    SSMIS = SSMIS.map(scaleSSMIS)
+    return applyFilters(SSMIS, params['SSMIS_filters'], inputs['DEM'], params)
+
+# Continuous SSMIS melt (difference with the winter mean), per melt year
+def stageMeltSSMIS(params, inputs):
+    SSMIS = inputs['SSMIS']
+
+    SSMIS_melt = None
+    for year in params['melt_years']:
+        SSMIS_winter = SSMIS.filterDate(*winterPeriod(year, params)).mean()
+        SSMIS_year = SSMIS.filterDate(*meltYearPeriod(year))
+
+        def meltComputationSSMIS(img):
+            return img.addBands(img.subtract(SSMIS_winter).toFloat().rename(['melt'])).copyProperties(img, ["system:time_start"])
+
+        SSMIS_year_melt = SSMIS_year.map(meltComputationSSMIS)
+        SSMIS_melt = SSMIS_year_melt if SSMIS_melt is None else SSMIS_melt.merge(SSMIS_year_melt)
+
+    SSMIS_melt = selectSummer(SSMIS_melt.select('melt'))
+
+    # Normalize each SSMIS image based on minumum and maximum values
+    SSMIS_melt = SSMIS_melt.map(lambda img: img.unitScale(params['SSMIS_melt_min'], params['SSMIS_melt_max']).copyProperties(img, ["system:time_start"]))
+
+    SSMIS_melt = reprojectCollection(SSMIS_melt, params)
+    return renameBandAddLocalTime(SSMIS_melt, 'melt_SSMIS')
+
+
+#############################################################################
+# Stages: combine satellite images
+#############################################################################
+
+# Satellite data that are matched per overpass (the other features do not depend on time)
+overpass_bands = ['melt_S1', 'HH_dB', 'melt_ascat', 'melt_SSMIS']
+
+def overpassInputs(params):
+    bands = [params['join_primary']] + params['join_order'] + params['features'] + params['labels']
+    return [b for b in overpass_bands if b in bands]
+
+# Match the overpasses of the satellite data (max. 2 hours difference in LocalTime) with the primary collection.
+# The matched images are combined in the order of 'join_order' (the first one provides the image properties, e.g. LocalTime):
+#   Step 1: primary melt_S1,    join_order [melt_S1, melt_ascat, melt_SSMIS]
+#   Step 4: primary melt_SSMIS, join_order [melt_ascat, melt_SSMIS]
+# The Sentinel-1 backscatter (HH_dB) is added with an exact match on LocalTime (same Sentinel-1 image).
+def stageOverpasses(params, inputs):
+    primary = params['join_primary']
+    secondaries = [b for b in params['join_order'] if b != primary]
+
+    # Define a max difference filter to compare timestamps
+    maxDiffFilter = ee.Filter.maxDifference(**{
+      'difference': 2 * 60 * 60 * 1000, # max. 2 hours difference
+      'leftField': 'LocalTime',
+      'rightField': 'LocalTime'
+    })
+
+    bestJoin = inputs[primary]
+    for band in secondaries:
+        saveBestJoin = ee.Join.saveBest(**{
+          'matchKey': 'bestImage_' + band,
+          'measureKey': 'timeDiff'})
+        bestJoin = ee.ImageCollection(saveBestJoin.apply(bestJoin, inputs[band], maxDiffFilter))
+
+    # Matched images per band
+    matched = {primary: bestJoin}
+    for band in secondaries:
+        matched[band] = bestJoin.map(lambda img: img.get('bestImage_' + band))
+
+    # Combined image collection
+    melt_all = matched[params['join_order'][0]]
+    for band in params['join_order'][1:]:
+        melt_all = melt_all.combine(matched[band])
+
+    if 'HH_dB' in params['overpass_bands']:
+
+        # Specify an equals filter for image timestamps.
+        filterTimeEq = ee.Filter.equals(**{
+          'leftField': 'LocalTime',
+          'rightField': 'LocalTime'
+        })
+
+        # Apply the inner join and merge the results
+        melt_all = ee.Join.inner().apply(melt_all, inputs['HH_dB'], filterTimeEq)
+        melt_all = ee.ImageCollection(melt_all.map(lambda feature: ee.Image.cat(feature.get('primary'), feature.get('secondary'))))
+
+    return melt_all
+
+def inputFeaturesInputs(params):
+    return ['overpasses', 'roi'] + [b for b in ['melt_S1_climatology', 'elevation', 'slope'] if b in params['features']]
+
+# Input features (and labels) in the order given in the configuration
+def stageInputFeatures(params, inputs):
+    melt_all = inputs['overpasses']
+
+    if 'melt_S1_climatology' in params['features']:
+        S1climatology = inputs['melt_S1_climatology']
+
+        # Add month and year to properties
+        def addMonthYearToProperties(img):
+            return img.set('month_meltAll', ee.Number.parse(ee.Date(img.get('system:time_start')).format("MM"))) \
+                      .set('year_meltAll', ee.Number.parse(ee.Date(img.get('system:time_start')).format("yyyy")))
+
+        # Add monthly climatology band to each image
+        def addS1ClimatologyBand(img):
+            matchingClimatology = S1climatology \
+                                  .filterMetadata('month', 'equals', img.get('month_meltAll')) \
+                                  .filterMetadata('year', 'equals', img.get('year_meltAll')) \
+                                  .first()
+            return img.addBands(ee.Image(matchingClimatology))
+
+        melt_all = melt_all.map(addMonthYearToProperties).map(addS1ClimatologyBand)
+
+    # Add elevation and slope band to each image
+    if 'elevation' in params['features']:
+        melt_all = melt_all.map(lambda img: img.addBands(inputs['elevation']))
+    if 'slope' in params['features']:
+        melt_all = melt_all.map(lambda img: img.addBands(inputs['slope']))
+
+    if params['clip_to_roi']:
+        melt_all = melt_all.map(lambda img: img.clip(inputs['roi']))
+
+    # Rearrange order of bands to get them in the same order as when the U-Net was trained
+    melt_all = melt_all.map(lambda img: img.select(params['features'] + params['labels']))
+
+    if params['start_poi'] is not None:
+        melt_all = melt_all.filterDate(params['start_poi'], params['end_poi'])
+    if params['summer_only']:
+        melt_all = selectSummer(melt_all)
+    return melt_all
+
+
+#############################################################################
+# Stages: prediction using trained U-Net model
+#############################################################################
+
+def stagePrediction(params, inputs):
+    model_params = params['model']
+
+    # Load the trained model and use it for prediction.
+    # (without version, the default version of the AI Platform model is used)
+    model_args = {
+        'projectName': model_params['project'],
+        'modelName': model_params['name'],
+        'inputTileSize': [model_params['input_tile_size'], model_params['input_tile_size']],
+        'inputShapes': {'array': [len(params['features'])]},
+        'inputOverlapSize': [model_params['input_overlap_size'], model_params['input_overlap_size']],
+        'proj': ee.Projection(params['crs']).atScale(params['scale_spatialres']),
+        'fixInputProj': True,
+        'outputBands': {'output': {'type': ee.PixelType.float()}}}
+    if model_params.get('version') is not None:
+        model_args['version'] = model_params['version']
+    model = ee.Model.fromAiPlatformPredictor(**model_args)
+
+    # Function to predict the labels as (1) percentags (0-100) and (2) binary (0: no melt, 1: melt)
+    def predictLabel(img):
+        inputs = img.float()
+        predictions = model.predictImage(inputs.toArray()).rename('prediction')
+        predictions_rounded = predictions.toArray().arrayGet([0]).round().rename('prediction_rounded')
+        return img.addBands(predictions).addBands(predictions_rounded)
+
+    return inputs['inputFeatures'].map(predictLabel).select('prediction')
+
+
+#############################################################################
+# Stage definitions
+#############################################################################
+
+# function: computes the stage from its parameters and inputs
+# params:   configuration parameters the stage depends on
+# inputs:   input stages (list, or function of the parameters)
+Stage = namedtuple('Stage', ['function', 'params', 'inputs'])
+
+reprojection_params = ['crs', 'scale_spatialres']
+
+stages = {
+    'roi':                 Stage(stageROI, ['roi'], []),
+    'DEM':                 Stage(stageDEM, reprojection_params, []),
+    'elevation':           Stage(stageElevation, ['elevation_max'] + reprojection_params, ['DEM']),
+    'slope':               Stage(stageSlope, ['slope_max'] + reprojection_params, ['DEM']),
+    'S1':                  Stage(stageS1, ['start_clim', 'end_clim', 'S1_filters', 'elevation_max'], ['roi', 'DEM']),
+    'melt_S1':             Stage(stageMeltS1, ['S1_melt_years', 'winter_start', 'winter_end', 'threshold_s0_dB'] + reprojection_params, ['S1']),
+    'HH_dB':               Stage(stageS1dB, [], ['S1']),
+    'melt_S1_climatology': Stage(stageS1Climatology, ['climatology_years'] + reprojection_params, ['melt_S1']),
+    'ascat':               Stage(stageAscat, ['ascat_assets', 'start_clim', 'end_clim', 'ascat_filters', 'elevation_max'], ['DEM']),
+    'melt_ascat':          Stage(stageMeltAscat, ['ascat_interpolation', 'melt_years', 'winter_start', 'winter_end', 'ascat_melt_min', 'ascat_melt_max'] + reprojection_params, ['ascat']),
+    'SSMIS':               Stage(stageSSMIS, ['SSMIS_assets', 'SSMIS_filters', 'elevation_max'], ['DEM']),
+    'melt_SSMIS':          Stage(stageMeltSSMIS, ['melt_years', 'winter_start', 'winter_end', 'SSMIS_melt_min', 'SSMIS_melt_max'] + reprojection_params, ['SSMIS']),
+    'overpasses':          Stage(stageOverpasses, ['join_primary', 'join_order', 'overpass_bands'], overpassInputs),
+    'inputFeatures':       Stage(stageInputFeatures, ['features', 'labels', 'clip_to_roi', 'start_poi', 'end_poi', 'summer_only'], inputFeaturesInputs),
+    'prediction':          Stage(stagePrediction, ['model', 'features'] + reprojection_params, ['inputFeatures']),
+}
+
+
+#############################################################################
+# Pipeline
+#############################################################################
+
+# A node of the compiled graph: one stage with its parameters and input nodes.
+# The key of a node is derived from the stage name, its parameters and the keys of its input nodes,
+# so that identical stages get the same key (and are computed once).
+Node = namedtuple('Node', ['key', 'stage', 'params', 'inputs'])
+
+class Pipeline:
+
+    # verbose: print the stages when they are computed
+    def __init__(self, config, verbose=False):
+        self.config = config
+        self.verbose = verbose
+        self.nodes = {}      # key: Node
+        self.outputs = {}    # run name: key of the output node
+        self.results = {}    # key: computed result (kept when runs are added, so that shared stages are reused)
+
+        for name, run_params in config.get('runs', {}).items():
+            self.addRun(name, run_params)
+
+    # Compile the stages of a run into the graph (stages already in the graph are reused)
+    def addRun(self, name, run_params):
+        params = runParameters(self.config, run_params)
+        self.outputs[name] = self._compile(params['output'], params)
+        return self.outputs[name]
+
+    def _compile(self, stage_name, params):
+        stage = stages[stage_name]
+        missing = [p for p in stage.params if p not in params]
+        if missing:
+            raise ValueError('Stage %s requires parameters %s' % (stage_name, ', '.join(missing)))
+
+        stage_params = {p: params[p] for p in stage.params}
+        input_names = stage.inputs(params) if callable(stage.inputs) else stage.inputs
+        inputs = {input_name: self._compile(input_name, params) for input_name in input_names}
+
+        description = json.dumps([stage_name, stage_params, inputs], sort_keys=True)
+        key = stage_name + '_' + hashlib.sha1(description.encode()).hexdigest()[:8]
+        if key not in self.nodes:
+            self.nodes[key] = Node(key, stage_name, stage_params, inputs)
+        return key
+
+    # Compute the output of a run (only the stages that were not computed before)
+    def run(self, name):
+        return self.compute(self.outputs[name])
+
+    def compute(self, key):
+        if key not in self.results:
+            node = self.nodes[key]
+            inputs = {input_name: self.compute(input_key) for input_name, input_key in node.inputs.items()}
+            if self.verbose:
+                print('Computing stage:', key)
+            self.results[key] = stages[node.stage].function(node.params, inputs)
+        return self.results[key]
+
+    # Result of a stage in a run (e.g. stage('prediction', 'roi') for the region of interest)
+    def stage(self, run_name, stage_name):
+        for key in self._dependencies(self.outputs[run_name]):
+            if self.nodes[key].stage == stage_name:
+                return self.compute(key)
+        raise KeyError('Run %s has no stage %s' % (run_name, stage_name))
+
+    def _dependencies(self, key):
+        keys = [key]
+        for input_key in self.nodes[key].inputs.values():
+            keys += [k for k in self._dependencies(input_key) if k not in keys]
+        return keys
+
+    # Overview of the compiled graph: stages per run, and the stages shared between runs
+    def summary(self):
+        for key in self.nodes:
+            runs = [name for name, output in self.outputs.items() if key in self._dependencies(output)]
+            state = 'computed' if key in self.results else 'not computed'
+            print('%-32s %-14s used by: %s' % (key, state, ', '.join(runs)))